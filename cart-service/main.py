@@ -5,6 +5,7 @@ import uuid
 import httpx
 import os
 from prometheus_fastapi_instrumentator import Instrumentator
+from ratelimit import LoadShedMiddleware
 
 root_path = os.getenv("ROOT_PATH", "")
 app = FastAPI(title="Cart Service API", root_path=root_path)
@@ -12,6 +13,9 @@ app = FastAPI(title="Cart Service API", root_path=root_path)
 # Initialize Prometheus metrics
 Instrumentator().instrument(app).expose(app)
 
+# Rate limit clients and shed load once the pod is saturated
+app.add_middleware(LoadShedMiddleware)
+
 # Cart item model
 class CartItem(BaseModel):
     product_id: str
@@ -7,6 +7,7 @@ import httpx
 from datetime import datetime
 import os
 from prometheus_fastapi_instrumentator import Instrumentator
+from ratelimit import LoadShedMiddleware, Priority
 
 root_path = os.getenv("ROOT_PATH", "")
 app = FastAPI(title="Order Service API", root_path=root_path)
@@ -14,6 +15,15 @@ app = FastAPI(title="Order Service API", root_path=root_path)
 # Initialize Prometheus metrics
 Instrumentator().instrument(app).expose(app)
 
+# Protect checkout and order writes over everything else when shedding load
+app.add_middleware(
+    LoadShedMiddleware,
+    rules=[
+        ("POST", r"^/orders/?$", Priority.CRITICAL),
+        ("PUT", r"^/orders/[^/]+/status$", Priority.CRITICAL),
+    ],
+)
+
 # Order status enum
 class OrderStatus(str, Enum):
     PENDING = "pending"
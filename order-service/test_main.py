@@ -1,5 +1,6 @@
 from fastapi.testclient import TestClient
 import pytest
+from prometheus_client import REGISTRY
 from unittest.mock import patch, MagicMock
 from main import app, orders_db, OrderStatus
 
@@ -94,4 +95,23 @@ def test_update_order_status(clear_db):
 def test_update_order_status_not_found():
     response = client.put("/orders/nonexistent-id/status", params={"status": "shipped"})
     assert response.status_code == 404
-    assert response.json() == {"detail": "Order not found"}
\ No newline at end of file
+    assert response.json() == {"detail": "Order not found"}
+
+def decisions(priority):
+    value = REGISTRY.get_sample_value(
+        "load_shed_decisions_total", {"priority": priority, "decision": "admitted"}
+    )
+    return value or 0
+
+def test_order_writes_are_critical(clear_db):
+    order_data = {"user_id": "test-user-1", "cart_id": "test-cart-1"}
+    critical, normal = decisions("critical"), decisions("normal")
+
+    create_response = client.post("/orders/", json=order_data)
+    order_id = create_response.json()["id"]
+    client.put(f"/orders/{order_id}/status", params={"status": "shipped"})
+    assert decisions("critical") == critical + 2
+
+    client.get(f"/orders/{order_id}")
+    assert decisions("critical") == critical + 2
+    assert decisions("normal") == normal + 1
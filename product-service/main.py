@@ -4,6 +4,7 @@ from typing import List, Optional
 import uuid
 import os
 from prometheus_fastapi_instrumentator import Instrumentator
+from ratelimit import LoadShedMiddleware, Priority
 
 root_path = os.getenv("ROOT_PATH", "")
 
@@ -12,6 +13,13 @@ app = FastAPI(title="Product Service API", root_path=root_path)
 # Initialize Prometheus metrics
 Instrumentator().instrument(app).expose(app)
 
+# Catalog browsing is the first thing shed under load; single product lookups
+# stay normal because cart and order fetch prices through them at checkout
+app.add_middleware(
+    LoadShedMiddleware,
+    rules=[("GET", r"^/products/?$", Priority.LOW)],
+)
+
 # Product model
 class Product(BaseModel):
     id: str
@@ -1,5 +1,6 @@
 from fastapi.testclient import TestClient
 import pytest
+from prometheus_client import REGISTRY
 from main import app, products_db
 
 client = TestClient(app)
@@ -131,4 +132,26 @@ def test_delete_product(clear_db):
 def test_delete_product_not_found():
     response = client.delete("/products/nonexistent-id")
     assert response.status_code == 404
-    assert response.json() == {"detail": "Product not found"}
\ No newline at end of file
+    assert response.json() == {"detail": "Product not found"}
+
+def admitted(priority):
+    value = REGISTRY.get_sample_value(
+        "load_shed_decisions_total", {"priority": priority, "decision": "admitted"}
+    )
+    return value or 0
+
+def test_only_catalog_listing_is_low_priority(clear_db):
+    product_data = {
+        "name": "Test Product",
+        "description": "This is a test product",
+        "price": 19.99,
+        "inventory": 100
+    }
+    create_response = client.post("/products/", json=product_data)
+    product_id = create_response.json()["id"]
+    low, normal = admitted("low"), admitted("normal")
+
+    client.get("/products/")
+    client.get(f"/products/{product_id}")
+    assert admitted("low") == low + 1
+    assert admitted("normal") == normal + 1
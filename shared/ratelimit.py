@@ -0,0 +1,268 @@
+import ipaddress
+import json
+import math
+import os
+import re
+import time
+from collections import OrderedDict
+from enum import Enum
+from typing import Iterable, List, Optional, Tuple, Union
+
+from prometheus_client import Counter, Gauge
+
+# Rate limiting / load shedding settings (overridable per deployment)
+RATE_LIMIT_RPS = float(os.getenv("RATE_LIMIT_RPS", "50"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "100"))
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "10000"))
+# Comma-separated CIDRs (e.g. the Emissary pods) allowed to set X-Forwarded-For
+TRUSTED_PROXIES = os.getenv("TRUSTED_PROXIES", "")
+# Comma-separated CIDRs (e.g. the pod network) whose direct calls are not rate limited
+RATE_LIMIT_EXEMPT_NETWORKS = os.getenv("RATE_LIMIT_EXEMPT_NETWORKS", "")
+LOAD_SHED_MAX_IN_FLIGHT = int(os.getenv("LOAD_SHED_MAX_IN_FLIGHT", "64"))
+LOAD_SHED_TARGET_LATENCY_MS = float(os.getenv("LOAD_SHED_TARGET_LATENCY_MS", "200"))
+LOAD_SHED_INTERVAL_MS = float(os.getenv("LOAD_SHED_INTERVAL_MS", "1000"))
+LOAD_SHED_MIN_SAMPLES = int(os.getenv("LOAD_SHED_MIN_SAMPLES", "5"))
+
+# Exported on /metrics alongside the Instrumentator metrics
+DECISIONS = Counter(
+    "load_shed_decisions_total",
+    "Admission decisions taken by the load shedding middleware",
+    ["priority", "decision"],
+)
+IN_FLIGHT = Gauge(
+    "load_shed_in_flight_requests",
+    "Requests currently being handled behind the load shedding middleware",
+)
+OVERLOADED = Gauge(
+    "load_shed_overloaded",
+    "1 while queued requests stay slower than the shedding target, 0 otherwise",
+)
+
+# Priority classes, from most to least protected
+class Priority(str, Enum):
+    CRITICAL = "critical"
+    NORMAL = "normal"
+    LOW = "low"
+
+# Share of LOAD_SHED_MAX_IN_FLIGHT each priority class may fill
+PRIORITY_SHARES = {
+    Priority.CRITICAL: 1.0,
+    Priority.NORMAL: 0.8,
+    Priority.LOW: 0.5,
+}
+
+# A rule maps (HTTP method, path regex) to a priority class
+PriorityRule = Tuple[str, str, Priority]
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+def parse_networks(value: str) -> List[Network]:
+    return [ipaddress.ip_network(cidr.strip(), strict=False) for cidr in value.split(",") if cidr.strip()]
+
+
+def in_networks(host: str, networks: List[Network]) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in networks)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        """Consume one token; return 0 if allowed, else seconds until one is available."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class LoadShedMiddleware:
+    """ASGI middleware combining per-client rate limiting with priority-aware load shedding.
+
+    Each client gets one token bucket per priority class, so a client hammering
+    catalog reads does not use up its own checkout budget. Independently, a
+    request is shed with a 503 when the in-flight count reaches its class's share
+    of ``max_in_flight``, or, unless it is CRITICAL, while the pod is overloaded.
+
+    Overload follows CoDel: every non-critical request has to finish slower than
+    ``target_latency_ms`` for a full ``interval_ms``, with at least ``min_samples``
+    of them and more than one non-critical request in flight at some point.
+    Any request under target resets this, so one slow client (e.g. a slow
+    upload) cannot trip it on its own.
+    """
+
+    def __init__(
+        self,
+        app,
+        rules: Iterable[PriorityRule] = (),
+        default_priority: Priority = Priority.NORMAL,
+        exempt_paths: Iterable[str] = ("/", "/metrics"),
+        trusted_proxies: str = TRUSTED_PROXIES,
+        exempt_networks: str = RATE_LIMIT_EXEMPT_NETWORKS,
+        rate: float = RATE_LIMIT_RPS,
+        burst: float = RATE_LIMIT_BURST,
+        max_clients: int = RATE_LIMIT_MAX_CLIENTS,
+        max_in_flight: int = LOAD_SHED_MAX_IN_FLIGHT,
+        target_latency_ms: float = LOAD_SHED_TARGET_LATENCY_MS,
+        interval_ms: float = LOAD_SHED_INTERVAL_MS,
+        min_samples: int = LOAD_SHED_MIN_SAMPLES,
+    ):
+        self.app = app
+        self.rules: List[Tuple[str, "re.Pattern[str]", Priority]] = [
+            (method.upper(), re.compile(pattern), priority)
+            for method, pattern, priority in rules
+        ]
+        self.default_priority = default_priority
+        self.exempt_paths = set(exempt_paths)
+        self.trusted_proxies = parse_networks(trusted_proxies)
+        self.exempt_networks = parse_networks(exempt_networks)
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.max_in_flight = max_in_flight
+        self.target_latency = target_latency_ms / 1000
+        self.interval = interval_ms / 1000
+        self.buckets: "OrderedDict[Tuple[str, Priority], TokenBucket]" = OrderedDict()
+        self.min_samples = min_samples
+        self.in_flight = 0
+        self.non_critical_in_flight = 0
+        self.overloaded_until = 0.0
+        # State of the current run of above-target samples
+        self.first_above_time = 0.0
+        self.last_sample_time = 0.0
+        self.above_samples = 0
+        self.above_peak = 0
+        OVERLOADED.set_function(lambda: 1 if self.is_overloaded(time.monotonic()) else 0)
+
+    def classify(self, method: str, path: str) -> Priority:
+        for rule_method, pattern, priority in self.rules:
+            if rule_method == method and pattern.match(path):
+                return priority
+        return self.default_priority
+
+    def client_id(self, scope) -> Optional[str]:
+        """Return the rate limiting key for a request, or None if it is exempt."""
+        client = scope.get("client")
+        peer = client[0] if client else "unknown"
+        if in_networks(peer, self.trusted_proxies):
+            # The last X-Forwarded-For hop is the one appended by our own ingress
+            for name, value in scope.get("headers", []):
+                if name == b"x-forwarded-for":
+                    return value.decode("latin-1").split(",")[-1].strip()
+            return peer
+        # Service-to-service calls (e.g. price lookups at checkout) are not rate limited
+        if in_networks(peer, self.exempt_networks):
+            return None
+        return peer
+
+    def check_rate(self, client: str, priority: Priority, now: float) -> float:
+        if self.rate <= 0:
+            return 0.0
+        key = (client, priority)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst, now)
+            self.buckets[key] = bucket
+            if len(self.buckets) > self.max_clients:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+        return bucket.take(now)
+
+    def should_shed(self, priority: Priority, now: float) -> bool:
+        if self.max_in_flight <= 0:
+            return False
+        if self.in_flight >= self.max_in_flight * PRIORITY_SHARES[priority]:
+            return True
+        return priority != Priority.CRITICAL and self.is_overloaded(now)
+
+    def is_overloaded(self, now: float) -> bool:
+        return now < self.overloaded_until
+
+    def reset_above_run(self):
+        self.first_above_time = 0.0
+        self.above_samples = 0
+        self.above_peak = self.non_critical_in_flight
+
+    def record_latency(self, latency: float, finished: float):
+        """Feed one non-critical request's latency into the CoDel overload check."""
+        # A gap longer than an interval means latency was not measured as staying high
+        if latency <= self.target_latency or finished - self.last_sample_time > self.interval:
+            self.reset_above_run()
+        self.last_sample_time = finished
+        if latency <= self.target_latency:
+            self.overloaded_until = 0.0
+            return
+
+        if not self.first_above_time:
+            self.first_above_time = finished
+        self.above_samples += 1
+        if (
+            finished - self.first_above_time >= self.interval
+            and self.above_samples >= self.min_samples
+            and self.above_peak > 1
+        ):
+            # Overload lapses one interval after the last slow sample, so it clears
+            # on its own even if shedding leaves no requests to measure
+            self.overloaded_until = finished + self.interval
+
+    async def reject(self, send, status_code: int, detail: str, retry_after: float):
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        priority = self.classify(scope["method"], scope["path"])
+        now = time.monotonic()
+
+        # Shed before rate limiting so a 503 does not cost the client a token
+        if self.should_shed(priority, now):
+            DECISIONS.labels(priority.value, "shed").inc()
+            await self.reject(send, 503, "Service overloaded", self.interval)
+            return
+
+        client = self.client_id(scope)
+        wait = self.check_rate(client, priority, now) if client is not None else 0.0
+        if wait:
+            DECISIONS.labels(priority.value, "rate_limited").inc()
+            await self.reject(send, 429, "Too many requests", wait)
+            return
+
+        DECISIONS.labels(priority.value, "admitted").inc()
+        # CRITICAL requests are never shed, so they must not trigger shedding either
+        sheddable = priority != Priority.CRITICAL
+        self.in_flight += 1
+        if sheddable:
+            self.non_critical_in_flight += 1
+            self.above_peak = max(self.above_peak, self.non_critical_in_flight)
+        IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
+            IN_FLIGHT.dec()
+            if sheddable:
+                self.non_critical_in_flight -= 1
+                finished = time.monotonic()
+                self.record_latency(finished - now, finished)
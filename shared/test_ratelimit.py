@@ -0,0 +1,208 @@
+import asyncio
+import time
+
+import httpx
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from ratelimit import LoadShedMiddleware, Priority
+
+inner_app = FastAPI()
+
+@inner_app.get("/")
+def read_root():
+    return {"message": "ok"}
+
+@inner_app.get("/items/")
+def read_items():
+    return []
+
+@inner_app.get("/slow/")
+async def read_slow():
+    await asyncio.sleep(0.05)
+    return []
+
+@inner_app.post("/checkout/")
+def checkout():
+    return {"message": "ok"}
+
+RULES = [
+    ("POST", r"^/checkout/", Priority.CRITICAL),
+    ("GET", r"^/items/", Priority.LOW),
+]
+
+def make_client(**kwargs):
+    middleware = LoadShedMiddleware(inner_app, rules=RULES, **kwargs)
+    return middleware, TestClient(middleware)
+
+def decisions(priority, decision):
+    value = REGISTRY.get_sample_value(
+        "load_shed_decisions_total", {"priority": priority, "decision": decision}
+    )
+    return value or 0
+
+def test_classify():
+    middleware, _ = make_client()
+    assert middleware.classify("POST", "/checkout/") == Priority.CRITICAL
+    assert middleware.classify("GET", "/items/") == Priority.LOW
+    assert middleware.classify("GET", "/checkout/") == Priority.NORMAL
+
+def test_admits_under_limits():
+    _, client = make_client()
+    before = decisions("low", "admitted")
+    response = client.get("/items/")
+    assert response.status_code == 200
+    assert decisions("low", "admitted") == before + 1
+
+def test_rate_limited_after_burst():
+    _, client = make_client(rate=0.5, burst=2)
+    before = decisions("low", "rate_limited")
+    assert client.get("/items/").status_code == 200
+    assert client.get("/items/").status_code == 200
+
+    response = client.get("/items/")
+    assert response.status_code == 429
+    assert response.json() == {"detail": "Too many requests"}
+    assert int(response.headers["retry-after"]) >= 1
+    assert decisions("low", "rate_limited") == before + 1
+
+def test_rate_limit_is_per_priority_and_client():
+    middleware, client = make_client(rate=0.5, burst=1)
+    assert client.get("/items/").status_code == 200
+    assert client.get("/items/").status_code == 429
+
+    # Checkout has its own bucket, and so does another client
+    assert client.post("/checkout/").status_code == 200
+    assert middleware.check_rate("10.0.0.3", Priority.LOW, time.monotonic()) == 0
+
+def test_forwarded_for_only_trusted_from_proxies():
+    middleware, _ = make_client(trusted_proxies="10.1.0.0/16")
+    proxied = {"client": ("10.1.2.3", 1234), "headers": [(b"x-forwarded-for", b"1.2.3.4, 5.6.7.8")]}
+    direct = {"client": ("10.2.0.1", 1234), "headers": [(b"x-forwarded-for", b"1.2.3.4, 5.6.7.8")]}
+
+    assert middleware.client_id(proxied) == "5.6.7.8"
+    assert middleware.client_id(direct) == "10.2.0.1"
+    assert middleware.client_id({"client": ("10.1.2.3", 1234), "headers": []}) == "10.1.2.3"
+
+def test_exempt_networks_skip_rate_limiting():
+    middleware, _ = make_client(trusted_proxies="10.1.0.0/24", exempt_networks="10.0.0.0/8")
+    proxied = {"client": ("10.1.0.5", 1234), "headers": [(b"x-forwarded-for", b"1.2.3.4")]}
+    internal = {"client": ("10.2.0.1", 1234), "headers": []}
+    external = {"client": ("1.2.3.4", 1234), "headers": []}
+
+    assert middleware.client_id(proxied) == "1.2.3.4"
+    assert middleware.client_id(internal) is None
+    assert middleware.client_id(external) == "1.2.3.4"
+
+def test_forwarded_for_ignored_without_trusted_proxies():
+    _, client = make_client(rate=0.5, burst=1)
+    assert client.get("/items/", headers={"X-Forwarded-For": "10.0.0.1"}).status_code == 200
+    # A fresh X-Forwarded-For value does not buy a fresh bucket
+    response = client.get("/items/", headers={"X-Forwarded-For": "10.0.0.2"})
+    assert response.status_code == 429
+
+def test_sheds_low_priority_at_in_flight_share():
+    middleware, client = make_client(max_in_flight=10)
+    middleware.in_flight = 5
+    before = decisions("low", "shed")
+
+    response = client.get("/items/")
+    assert response.status_code == 503
+    assert response.json() == {"detail": "Service overloaded"}
+    assert "retry-after" in response.headers
+    assert decisions("low", "shed") == before + 1
+
+    assert client.post("/checkout/").status_code == 200
+
+def overload(middleware, latency, samples=6, peak=2):
+    # Feed a run of slow samples spanning more than an interval, with `peak`
+    # non-critical requests in flight while it lasted
+    start = time.monotonic()
+    middleware.non_critical_in_flight = peak
+    for i in range(samples):
+        middleware.record_latency(latency, start + 0.03 * i)
+    middleware.non_critical_in_flight = 0
+
+def test_shed_requests_do_not_use_rate_tokens():
+    middleware, client = make_client(rate=0.5, burst=1, max_in_flight=10)
+    middleware.in_flight = 5
+    assert client.get("/items/").status_code == 503
+    assert client.get("/items/").status_code == 503
+
+    # Retrying after the 503 still finds the client's token unspent
+    middleware.in_flight = 0
+    assert client.get("/items/").status_code == 200
+
+def test_sheds_non_critical_while_overloaded():
+    middleware, client = make_client(target_latency_ms=10, interval_ms=100)
+    overload(middleware, latency=0.5)
+    assert middleware.overloaded_until > time.monotonic()
+
+    assert client.get("/items/").status_code == 503
+    assert client.post("/checkout/").status_code == 200
+
+def test_one_slow_request_does_not_shed():
+    middleware, client = make_client(target_latency_ms=10, interval_ms=100)
+    start = time.monotonic()
+    middleware.non_critical_in_flight = 2
+    for i in range(6):
+        latency = 0.5 if i == 3 else 0.001
+        middleware.record_latency(latency, start + 0.03 * i)
+    middleware.non_critical_in_flight = 0
+
+    assert middleware.overloaded_until == 0
+    assert client.get("/items/").status_code == 200
+
+def test_slow_request_alongside_critical_does_not_shed():
+    middleware, _ = make_client(target_latency_ms=10, interval_ms=20, min_samples=1)
+    transport = httpx.ASGITransport(app=middleware)
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            slow, checkout = await asyncio.gather(client.get("/slow/"), client.post("/checkout/"))
+            assert slow.status_code == 200
+            assert checkout.status_code == 200
+            return await client.get("/items/")
+
+    assert asyncio.run(scenario()).status_code == 200
+    assert not middleware.is_overloaded(time.monotonic())
+
+def test_too_few_slow_samples_do_not_shed():
+    middleware, client = make_client(target_latency_ms=10, interval_ms=100)
+    overload(middleware, latency=0.5, samples=4)
+
+    assert middleware.overloaded_until == 0
+    assert client.get("/items/").status_code == 200
+
+def test_slow_requests_without_queueing_do_not_shed():
+    middleware, client = make_client(target_latency_ms=10, interval_ms=100)
+    overload(middleware, latency=0.5, peak=1)
+
+    assert middleware.overloaded_until == 0
+    assert client.get("/items/").status_code == 200
+
+def test_fast_request_ends_overload():
+    middleware, client = make_client(target_latency_ms=10, interval_ms=100)
+    overload(middleware, latency=0.5)
+    middleware.record_latency(0.001, time.monotonic())
+
+    assert client.get("/items/").status_code == 200
+
+def test_critical_latency_does_not_trip_overload():
+    middleware, client = make_client(target_latency_ms=0, interval_ms=0, min_samples=1)
+    assert client.post("/checkout/").status_code == 200
+    assert middleware.above_samples == 0
+
+def test_overloaded_gauge_clears_without_requests():
+    middleware, _ = make_client(target_latency_ms=10, interval_ms=100)
+    overload(middleware, latency=0.5)
+    assert REGISTRY.get_sample_value("load_shed_overloaded") == 1
+
+    middleware.overloaded_until = time.monotonic() - 1
+    assert REGISTRY.get_sample_value("load_shed_overloaded") == 0
+
+def test_exempt_paths_bypass_limits():
+    middleware, client = make_client(rate=0.5, burst=1, max_in_flight=1)
+    middleware.in_flight = 1
+    for _ in range(3):
+        assert client.get("/").status_code == 200